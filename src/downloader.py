@@ -5,18 +5,28 @@
 """
 
 import os
-import json
+import copy
+import time
+import hashlib
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import orjson
 from yt_dlp import YoutubeDL
 from tqdm import tqdm
 
+from metadata import META_DIR, load_index, update_index
+
 BASE_DIR = Path(__file__).resolve().parents[1]
 AUDIO_DIR = BASE_DIR / "data" / "audio"
-META_DIR = BASE_DIR / "data" / "metadata"
+YTDL_CACHE_DIR = META_DIR / "_ytdl_cache"
 
-for directory in (AUDIO_DIR, META_DIR):
+for directory in (AUDIO_DIR, YTDL_CACHE_DIR):
     directory.mkdir(parents=True, exist_ok=True)
 
+# How long (seconds) a cached extract_info result for a URL stays valid; override
+# with YTDL_CACHE_TTL, or pass refresh=True / --refresh to bypass the cache once
+YTDL_CACHE_TTL = int(os.environ.get("YTDL_CACHE_TTL", 7 * 24 * 60 * 60))
+
 YTDL_OPTS = {
     "format": "bestaudio/best",
     "outtmpl": str(AUDIO_DIR / "%(id)s.%(ext)s"),
@@ -24,69 +34,173 @@ YTDL_OPTS = {
     "quiet": True,
     "no_warnings": True,
     "noplaylist": False,
+    # fetch DASH/HLS fragments in parallel and in 10 MiB HTTP chunks
+    "concurrent_fragment_downloads": 8,
+    "http_chunk_size": 10485760,
+    "retries": 3,
+    # keep yt-dlp's default clients and add android as an extra format source;
+    # android alone needs a PO token for HTTPS formats and fails silently here
+    "extractor_args": {"youtube": {"player_client": ["default", "android"]}},
     "postprocessors": [
         {"key": "FFmpegExtractAudio", "preferredcodec": "mp3", "preferredquality": "192"},
     ]
 }
 
-def download(url: str) -> list:
+# Upper bound on parallel per-video downloads
+MAX_WORKERS = 8
+
+
+def _process_entry(entry: dict):
     """
-    Downloads audio for the given youtube video or playlist URL.
-    Returns a list of dicts containing {video_id, title, filepath, duration, webpage_url}
+    Downloads a single playlist entry with its own YoutubeDL instance and builds its metadata.
+    Returns (meta, skipped): meta is None if the entry could not be downloaded, skipped is
+    True if the audio already existed and meta only holds the fields from the listing.
     """
-    results = []
-    with YoutubeDL(YTDL_OPTS) as ydl:
+    if entry is None:
+        return None, False
+    entry_url = entry.get("url") or entry.get("webpage_url")
+
+    # already downloaded on a previous run
+    mp3_path = AUDIO_DIR / f"{entry.get('id')}.mp3"
+    if entry.get("id") and mp3_path.exists():
+        return {
+            "video_id": entry["id"],
+            "title": entry.get("title"),
+            "webpage_url": entry.get("webpage_url") or entry_url,
+            "duration": entry.get("duration"),
+            "audio_path": str(mp3_path),
+        }, True
+
+    # resolve and download in one call so each video is only extracted once
+    try:
+        # YoutubeDL instances (and the params dict they mutate) are not shared across threads
+        with YoutubeDL(copy.deepcopy(YTDL_OPTS)) as ydl:
+            if entry.get("_type") == "url":
+                # flat playlist entry, not resolved yet
+                info = ydl.extract_info(entry["url"], download=True)
+            else:
+                # already fully extracted (single video URL)
+                info = ydl.process_ie_result(entry, download=True)
+    except Exception as e:
+        print(f"[WARN] Failed to download {entry_url}: {e}")
+        return None, False
+    if info is None:
+        print(f"[WARN] Failed to download {entry_url}")
+        return None, False
+
+    video_id = info.get("id")
+    title = info.get("title")
+    webpage_url = info.get("webpage_url")
+    duration = info.get("duration")
+
+    # expected mp3 path
+    mp3_path = AUDIO_DIR / f"{video_id}.mp3"
+    if not mp3_path.exists():
+        # sometimes extension may vary — search for files with prefix
+        matches = list(AUDIO_DIR.glob(f"{video_id}.*"))
+        mp3_path = matches[0] if matches else None
+
+    return {
+        "video_id": video_id,
+        "title": title,
+        "webpage_url": webpage_url,
+        "duration": duration,
+        "audio_path": str(mp3_path) if mp3_path else None,
+    }, False
+
+
+def _extract_info(url: str, refresh: bool = False):
+    """
+    Lists the entries of a video or playlist URL, cached on disk for YTDL_CACHE_TTL seconds.
+    With refresh=True the cache is ignored and rewritten.
+    Returns the (flat) info dict, or None if extraction failed.
+    """
+    cache_file = YTDL_CACHE_DIR / f"{hashlib.sha1(url.encode()).hexdigest()}.json"
+    age = time.time() - cache_file.stat().st_mtime if cache_file.exists() else None
+    if not refresh and age is not None and age < YTDL_CACHE_TTL:
+        try:
+            info = orjson.loads(cache_file.read_bytes())
+            print(f"Using listing cached {age / 3600:.1f}h ago; pass --refresh to pick up new videos.")
+            return info
+        except orjson.JSONDecodeError:
+            pass
+
+    # list playlist entries without resolving every video up front
+    with YoutubeDL({**copy.deepcopy(YTDL_OPTS), "extract_flat": "in_playlist"}) as ydl:
         info = ydl.extract_info(url, download=False)
-        entries = info.get("entries") if info.get("entries") else [info]
+        if info is None:
+            return None
+        info = ydl.sanitize_info(info)
 
-        # iterate through entries and download each
-        for entry in tqdm(entries, desc="\nProcessing items"):
-            if entry is None:
-                continue
-            video_id = entry.get("id")
-            title = entry.get("title")
-            webpage_url = entry.get("webpage_url")
-            duration = entry.get("duration")
-            # download single video by id
-            try:
-                # use a per-item download call to ensure file naming
-                ydl.download([webpage_url])
-            except Exception as e:
-                print(f"[WARN] Failed to download {webpage_url}: {e}")
-                continue
+    cached = info
+    if info.get("_type") != "playlist":
+        # stream URLs of a resolved video expire, so cache only a reference to it
+        cached = {
+            "_type": "url",
+            "url": info.get("webpage_url"),
+            "id": info.get("id"),
+            "title": info.get("title"),
+            "webpage_url": info.get("webpage_url"),
+            "duration": info.get("duration"),
+        }
+
+    tmp_file = cache_file.with_suffix(".json.tmp")
+    tmp_file.write_bytes(orjson.dumps(cached, option=orjson.OPT_NON_STR_KEYS))
+    os.replace(tmp_file, cache_file)
+    return info
 
-            # expected mp3 path
-            mp3_path = AUDIO_DIR / f"{video_id}.mp3"
-            if not mp3_path.exists():
-                # sometimes extension may vary — search for files with prefix
-                matches = list(AUDIO_DIR.glob(f"{video_id}.*"))
-                mp3_path = matches[0] if matches else None
 
-            meta = {
-                "video_id": video_id,
-                "title": title,
-                "webpage_url": webpage_url,
-                "duration": duration,
-                "audio_path": str(mp3_path) if mp3_path else None,
-            }
+def download(url: str, on_downloaded=None, refresh: bool = False) -> list:
+    """
+    Downloads audio for the given youtube video or playlist URL.
+    If given, on_downloaded(meta) is called as soon as each item finishes.
+    refresh=True re-fetches the playlist listing instead of using the cached one.
+    Returns a list of dicts containing {video_id, title, filepath, duration, webpage_url}
+    """
+    info = _extract_info(url, refresh=refresh)
+    if info is None:
+        return []
+    # materialize lazy playlist entries once so the progress bar knows its total
+    entries = [entry for entry in (info.get("entries") or [info]) if entry is not None]
+    if not entries:
+        return []
+
+    index = load_index()
 
-            # write metadata json
-            meta_file = META_DIR / f"{video_id}.json"
-            with open(meta_file, "w", encoding="utf-8") as f:
-                json.dump(meta, f, ensure_ascii=False, indent=2)
+    # download entries in parallel, each worker owning its YoutubeDL instance
+    results = [None] * len(entries)
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(entries))) as executor:
+        futures = {executor.submit(_process_entry, entry): i for i, entry in enumerate(entries)}
+        for future in tqdm(as_completed(futures), total=len(futures), mininterval=1.0, desc="Downloading"):
+            meta, skipped = future.result()
+            if meta is None:
+                continue
+            delta = meta
+            if skipped:
+                # listing fields must not replace the fully resolved ones already recorded
+                known = index.get(meta["video_id"], {})
+                delta = {key: value for key, value in meta.items() if known.get(key) is None}
+                meta = {**meta, **{key: known[key] for key in meta if known.get(key) is not None}}
+            results[futures[future]] = meta
 
-            results.append(meta)
+            # record metadata as soon as each item finishes
+            if set(delta) - {"video_id"}:
+                update_index(meta["video_id"], delta)
+            if on_downloaded is not None:
+                on_downloaded(meta)
 
-    return results
+    # keep playlist order, dropping failed items
+    return [meta for meta in results if meta is not None]
 
 if __name__ == "__main__":
     import argparse
 
     parser = argparse.ArgumentParser(description="Download audio from a YouTube video or playlist")
     parser.add_argument("url", help="YouTube video or playlist URL")
+    parser.add_argument("--refresh", action="store_true", help="Re-fetch the playlist listing instead of using the cache")
     args = parser.parse_args()
 
-    out = download(args.url)
+    out = download(args.url, refresh=args.refresh)
     print("\nDownloaded items:")
     for item in out:
         print(f"\n- {item['video_id']}: {item['title']} -> {item['audio_path']}")
\ No newline at end of file
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+metadata.py
+
+Shared per-video metadata index for the download, transcribe and summarize stages.
+Stored as data/metadata/index.jsonl, an append-only log of per-video metadata deltas
+that are merged by video_id on load. Each delta is appended as soon as it is known,
+so an interrupted run keeps everything recorded so far and separate stage scripts
+never overwrite each other's updates.
+
+Once the log holds many superseded deltas it is rewritten compacted (one line per
+video) with os.replace. Per-video data/metadata/<video_id>.json files written by
+older versions are folded into the index on first load and moved to _legacy/.
+"""
+
+import os
+import shutil
+import threading
+from pathlib import Path
+
+import orjson
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+META_DIR = BASE_DIR / "data" / "metadata"
+META_DIR.mkdir(parents=True, exist_ok=True)
+
+INDEX_FILE = META_DIR / "index.jsonl"
+LEGACY_DIR = META_DIR / "_legacy"
+
+# Compact the log once it has this many lines and more than two per video
+COMPACT_MIN_LINES = 200
+
+# Serializes appends and compaction from threads of the same process
+_lock = threading.Lock()
+
+
+def _merge_lines(data: bytes, index: dict) -> int:
+    """Merge the deltas in `data` into `index` and return the number of lines read."""
+    lines = 0
+    for line in data.splitlines():
+        if not line.strip():
+            continue
+        lines += 1
+        try:
+            meta = orjson.loads(line)
+        except orjson.JSONDecodeError:
+            # a crash mid-append can leave a truncated last line
+            continue
+        index.setdefault(meta["video_id"], {}).update(meta)
+    return lines
+
+
+def _load_legacy(index: dict) -> list:
+    """Fold per-video <video_id>.json files into `index` and return the files read."""
+    migrated = []
+    for meta_file in sorted(META_DIR.glob("*.json")):
+        try:
+            meta = orjson.loads(meta_file.read_bytes())
+        except (OSError, orjson.JSONDecodeError) as e:
+            print(f"[WARN] Could not migrate {meta_file.name}: {e}")
+            continue
+        video_id = meta.get("video_id") or meta_file.stem
+        # anything already in the log is newer than the legacy file
+        index[video_id] = {**meta, "video_id": video_id, **index.get(video_id, {})}
+        migrated.append(meta_file)
+    return migrated
+
+
+def _compact(index: dict, read_size: int):
+    """Atomically rewrite the log as one line per video."""
+    # keep deltas appended by other processes since the log was read
+    if INDEX_FILE.exists():
+        _merge_lines(INDEX_FILE.read_bytes()[read_size:], index)
+
+    tmp_file = INDEX_FILE.with_suffix(".jsonl.tmp")
+    tmp_file.write_bytes(b"".join(
+        orjson.dumps(meta, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE)
+        for meta in index.values()
+    ))
+    os.replace(tmp_file, INDEX_FILE)
+
+
+def load_index() -> dict:
+    """Load the metadata index, merging all deltas, and return {video_id: meta}."""
+    index = {}
+    with _lock:
+        data = INDEX_FILE.read_bytes() if INDEX_FILE.exists() else b""
+        lines = _merge_lines(data, index)
+
+        legacy_files = _load_legacy(index)
+        if legacy_files or lines > max(COMPACT_MIN_LINES, 2 * len(index)):
+            _compact(index, len(data))
+
+        if legacy_files:
+            LEGACY_DIR.mkdir(exist_ok=True)
+            for meta_file in legacy_files:
+                try:
+                    shutil.move(str(meta_file), str(LEGACY_DIR / meta_file.name))
+                except FileNotFoundError:
+                    # already moved by a concurrent run
+                    pass
+            print(f"Migrated {len(legacy_files)} per-video metadata files into {INDEX_FILE.name}.")
+    return index
+
+
+def update_index(video_id: str, delta: dict):
+    """Append the known (non-None) fields of a metadata delta for one video to the index."""
+    record = {"video_id": video_id}
+    record.update({key: value for key, value in delta.items() if value is not None})
+    line = orjson.dumps(record, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE)
+
+    # one O_APPEND write per delta, so concurrent writers never interleave lines
+    with _lock:
+        fd = os.open(INDEX_FILE, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+pipeline.py
+
+Runs download -> transcribe -> summarize as overlapping stages connected by queues,
+so transcription starts while the rest of a playlist is still downloading.
+Each stage keeps its model loaded for the whole run and appends its metadata
+deltas to the shared index as soon as each item finishes.
+"""
+
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import downloader
+import summarizer
+import transcriber
+from metadata import load_index, update_index
+
+# Marks the end of a stage's output on its queue
+_DONE = None
+
+
+def download_stage(url: str, trans_q: queue.Queue, refresh: bool = False):
+    """Download audio and queue every finished item for transcription."""
+    # download() records the metadata of each item itself
+    def on_downloaded(meta):
+        if meta["audio_path"]:
+            trans_q.put({"video_id": meta["video_id"], "audio_path": Path(meta["audio_path"])})
+
+    try:
+        downloader.download(url, on_downloaded=on_downloaded, refresh=refresh)
+    except Exception as e:
+        print(f"[WARN] Download stage failed: {e}")
+    finally:
+        trans_q.put(_DONE)
+
+
+def transcribe_stage(trans_q: queue.Queue, summ_q: queue.Queue, index: dict):
+    """
+    Transcribe queued audio and queue the transcripts for summarization.
+    `index` is the metadata index loaded at startup, used to backfill skipped items.
+    """
+    model = None
+    model_loaded = False
+    # (item, future) pairs: audio decoding ahead of the file being transcribed,
+    # as in transcriber.prefetch_audio
+    decoding = deque()
+    finished = False
+    try:
+        with ThreadPoolExecutor(max_workers=transcriber.PREFETCH) as executor:
+            while not finished or decoding:
+                # top up the prefetch queue; only block on downloads when nothing is decoding
+                while not finished and len(decoding) <= transcriber.PREFETCH:
+                    try:
+                        item = trans_q.get(block=not decoding)
+                    except queue.Empty:
+                        break
+                    if item is _DONE:
+                        finished = True
+                        break
+
+                    video_id, audio_path = item["video_id"], item["audio_path"]
+                    transcript_path = transcriber.TRANS_DIR / f"{video_id}.txt"
+
+                    # Skip already processed, recording the transcript if an earlier run did not
+                    if transcript_path.exists():
+                        if "transcript_path" not in index.get(video_id, {}):
+                            update_index(video_id, {"transcript_path": str(transcript_path)})
+                        summ_q.put({"video_id": video_id, "transcript_path": transcript_path})
+                        continue
+
+                    # load once, on the first file that needs it; a failed load is not retried
+                    if not model_loaded:
+                        model_loaded = True
+                        try:
+                            model = transcriber.load_model()
+                        except Exception as e:
+                            print(f"[WARN] Failed to load whisper model, not transcribing: {e}")
+                    if model is None:
+                        continue
+
+                    decoding.append((item, executor.submit(transcriber.decode_audio, audio_path)))
+
+                if not decoding:
+                    continue
+
+                item, decoded = decoding.popleft()
+                video_id, audio_path = item["video_id"], item["audio_path"]
+                try:
+                    text, segments = transcriber.transcribe_audio(decoded.result(), model)
+                    transcript_path = transcriber.save_transcript(video_id, text, segments)
+                except Exception as e:
+                    print(f"[WARN] Failed to transcribe {audio_path.name}: {e}")
+                    continue
+
+                update_index(video_id, {"transcript_path": str(transcript_path)})
+                summ_q.put({"video_id": video_id, "transcript_path": transcript_path})
+    finally:
+        summ_q.put(_DONE)
+
+
+def summarize_stage(summ_q: queue.Queue, index: dict):
+    """
+    Summarize queued transcripts.
+    `index` is the metadata index loaded at startup, used to backfill skipped items.
+    """
+    model = tokenizer = None
+    model_loaded = False
+    while (item := summ_q.get()) is not _DONE:
+        video_id, transcript_path = item["video_id"], item["transcript_path"]
+
+        # Skip if already summarized, recording the summary if an earlier run did not
+        output_file = summarizer.SUMM_DIR / f"{video_id}_summary.txt"
+        if output_file.exists():
+            if "summary_path" not in index.get(video_id, {}):
+                update_index(video_id, {"summary_path": str(output_file)})
+            continue
+
+        try:
+            with open(transcript_path, "r", encoding="utf-8") as f:
+                text = f.read().strip()
+            if len(text) < summarizer.MIN_TRANSCRIPT_CHARS:
+                continue
+
+            # load lazily so a fully cached run never touches BART
+            if not model_loaded:
+                model_loaded = True
+                try:
+                    model, tokenizer = summarizer.load_model()
+                except Exception as e:
+                    print(f"[WARN] Falling back to extractive summarization due to: {e}")
+
+            summary_text = summarizer.summarize_text(text, model, tokenizer)
+            output_file = summarizer.save_summary(video_id, summary_text)
+        except Exception as e:
+            print(f"[WARN] Failed to summarize {transcript_path.name}: {e}")
+            continue
+
+        update_index(video_id, {"summary_path": str(output_file)})
+
+
+def run(url: str, refresh: bool = False):
+    """
+    Download, transcribe and summarize the given youtube video or playlist URL.
+    refresh=True re-fetches the playlist listing instead of using the cached one.
+    """
+    index = load_index()
+    trans_q = queue.Queue()
+    summ_q = queue.Queue()
+
+    threads = [
+        threading.Thread(target=download_stage, args=(url, trans_q, refresh), name="download"),
+        threading.Thread(target=transcribe_stage, args=(trans_q, summ_q, index), name="transcribe"),
+        threading.Thread(target=summarize_stage, args=(summ_q, index), name="summarize"),
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    print("\nPipeline complete.")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Download, transcribe and summarize a YouTube video or playlist")
+    parser.add_argument("url", help="YouTube video or playlist URL")
+    parser.add_argument("--refresh", action="store_true", help="Re-fetch the playlist listing instead of using the cache")
+    args = parser.parse_args()
+
+    run(args.url, refresh=args.refresh)
@@ -7,101 +7,301 @@ Saves per-video summaries in data/summaries/<video_id>_summary.txt
 """
 
 import os
-import json
+from contextlib import contextmanager
 from pathlib import Path
 from tqdm import tqdm
 
-from transformers import pipeline
+import torch
+from transformers import AutoModelForSeq2SeqLM, AutoTokenizer, BitsAndBytesConfig
 from sumy.parsers.plaintext import PlaintextParser
 from sumy.nlp.tokenizers import Tokenizer
 from sumy.summarizers.lex_rank import LexRankSummarizer
 
 import nltk
 
+from metadata import load_index, update_index
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+TRANS_DIR = BASE_DIR / "data" / "transcripts"
+SUMM_DIR = BASE_DIR / "data" / "summaries"
+SUMM_DIR.mkdir(parents=True, exist_ok=True)
+
+# Written once the NLTK resources are known to be installed; holds the NLTK
+# search path it was written for, so a different data dir or venv re-checks
+NLTK_SENTINEL = BASE_DIR / "data" / ".nltk_ready"
+_nltk_ready = False
+
+
 def ensure_nltk_resources():
     """Download required NLTK resources if missing."""
+    global _nltk_ready
+    search_path = "\n".join(nltk.data.path)
+    if _nltk_ready or (NLTK_SENTINEL.exists() and NLTK_SENTINEL.read_text(encoding="utf-8") == search_path):
+        _nltk_ready = True
+        return
+
     required = ["punkt", "punkt_tab"]
+    missing = []
     for resource in required:
         try:
             nltk.data.find(f"tokenizers/{resource}")
         except LookupError:
+            # nltk.download reports failure by returning False, so check again afterwards
             nltk.download(resource, quiet=True)
+            try:
+                nltk.data.find(f"tokenizers/{resource}")
+            except LookupError:
+                missing.append(resource)
+
+    if missing:
+        print(f"[WARN] Missing NLTK resources: {', '.join(missing)}")
+        return
+    NLTK_SENTINEL.write_text(search_path, encoding="utf-8")
+    _nltk_ready = True
 
 ensure_nltk_resources()
 
-BASE_DIR = Path(__file__).resolve().parents[1]
-TRANS_DIR = BASE_DIR / "data" / "transcripts"
-SUMM_DIR = BASE_DIR / "data" / "summaries"
-META_DIR = BASE_DIR / "data" / "metadata"
-SUMM_DIR.mkdir(parents=True, exist_ok=True)
+# LexRank tokenizer and summarizer are stateless, so share one instance of each.
+# The tokenizer loads punkt when constructed, so it is only built on first use and
+# a missing punkt fails the extractive path rather than the whole import.
+_TOKENIZER = None
+_LEX = LexRankSummarizer()
+
+MODEL_NAME = "facebook/bart-large-cnn"
 
+# BART has a 1024 token input limit; windows of 900 tokens overlapping by 50
+CHUNK_TOKENS = 900
+CHUNK_STRIDE = 850
 
-def abstractive_summary(text: str, summarizer):
-    """Summarize text using transformer pipeline."""
-    # BART models have a max token limit (1024). We'll chunk long transcripts.
-    max_chunk = 5000  # roughly 3000 chars per chunk
-    chunks = [text[i:i + max_chunk] for i in range(0, len(text), max_chunk)]
+# Chunks are padded to this many tokens (window + BOS/EOS) on the compiled path
+PADDED_CHUNK_TOKENS = CHUNK_TOKENS + 2
+
+# Number of chunks passed through generate() together
+BATCH_SIZE = 8
+
+# Transcripts shorter than this are not worth summarizing
+MIN_TRANSCRIPT_CHARS = 100
+
+# Transcripts longer than this are cut to their top LexRank sentences before BART
+LONG_TRANSCRIPT_CHARS = 20000
+LONG_TRANSCRIPT_SENTENCES = 40
+
+SUMMARY_MAX_LENGTH = 400
+SUMMARY_MIN_LENGTH = 150
+NUM_BEAMS = 2
+
+# Compile the GPU model with torch.compile; set SUMMARIZER_COMPILE=0 to disable
+COMPILE_MODEL = os.environ.get("SUMMARIZER_COMPILE", "1") == "1" and torch.cuda.is_available()
+
+
+def load_model():
+    """Load the BART tokenizer and model, quantized to int8 on GPU when bitsandbytes is available."""
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+    if not torch.cuda.is_available():
+        model = AutoModelForSeq2SeqLM.from_pretrained(MODEL_NAME)
+        return model.eval(), tokenizer
+
+    try:
+        import bitsandbytes  # noqa: F401
+        model = AutoModelForSeq2SeqLM.from_pretrained(
+            MODEL_NAME,
+            quantization_config=BitsAndBytesConfig(load_in_8bit=True),
+            device_map="auto",
+        )
+    except Exception as e:
+        # missing or broken bitsandbytes (CUDA/lib mismatch, unsupported GPU)
+        print(f"[WARN] 8-bit load failed, loading BART in fp16 instead: {e}")
+        model = AutoModelForSeq2SeqLM.from_pretrained(MODEL_NAME, dtype=torch.float16).to("cuda:0")
+    model.eval()
+
+    if COMPILE_MODEL:
+        compile_model(model)
+    return model, tokenizer
+
+
+def compile_model(model) -> bool:
+    """
+    Compile the model forward pass for generation with a static KV cache and pay the
+    compilation cost up front, warming up every batch size abstractive_summary uses.
+    Returns False, leaving the eager model untouched, when the model cannot be compiled
+    (no static cache support, a non-compileable quantizer such as bitsandbytes 8-bit)
+    or when compilation or warm-up fails (e.g. no working Triton).
+    """
+    if not (getattr(model, "_supports_static_cache", False) or getattr(model, "_can_compile_fullgraph", False)):
+        print("[WARN] Model does not support a static KV cache, skipping torch.compile")
+        return False
+    quantizer = getattr(model, "hf_quantizer", None)
+    if quantizer is not None and not getattr(quantizer, "is_compileable", False):
+        print("[WARN] Quantized model cannot be compiled, skipping torch.compile")
+        return False
+
+    try:
+        # generate() calls forward; the eager forward stays on the model for short inputs
+        model.compiled_forward = torch.compile(model.forward, mode="reduce-overhead", fullgraph=False)
+
+        # one warm-up per batch size, at the PADDED_CHUNK_TOKENS length and max_length used
+        # later so the static cache shapes match; min_length=0 keeps each run short
+        for batch_size in range(1, BATCH_SIZE + 1):
+            dummy_ids = torch.zeros((batch_size, PADDED_CHUNK_TOKENS), dtype=torch.long, device=model.device)
+            with _compiled_forward(model):
+                model.generate(
+                    input_ids=dummy_ids,
+                    attention_mask=torch.ones_like(dummy_ids),
+                    max_length=SUMMARY_MAX_LENGTH,
+                    min_length=0,
+                    num_beams=NUM_BEAMS,
+                    do_sample=False,
+                    cache_implementation="static",
+                    disable_compile=True,
+                )
+    except Exception as e:
+        print(f"[WARN] torch.compile failed, using the eager model: {e}")
+        if hasattr(model, "compiled_forward"):
+            del model.compiled_forward
+        return False
+    return True
+
+
+@contextmanager
+def _compiled_forward(model):
+    """Route generate() through the compiled forward pass for the duration of the block."""
+    model.forward = model.compiled_forward
+    try:
+        yield
+    finally:
+        # drop the instance attribute so the class (eager) forward is used again
+        del model.forward
+
+
+def abstractive_summary(text: str, model, tokenizer):
+    """Summarize text using a seq2seq transformer model."""
+    # Tokenize once and slide overlapping token windows over long transcripts
+    ids = tokenizer(text, add_special_tokens=False, verbose=False).input_ids
+    overlap = CHUNK_TOKENS - CHUNK_STRIDE
+    # BART inputs are <s> window </s>
+    chunks = [
+        [tokenizer.bos_token_id] + ids[i:i + CHUNK_TOKENS] + [tokenizer.eos_token_id]
+        for i in range(0, max(len(ids) - overlap, 1), CHUNK_STRIDE)
+    ]
+
+    # Transcripts spanning several chunks (or one full chunk) go through the compiled
+    # model with every chunk padded to PADDED_CHUNK_TOKENS; compile_model warmed up each
+    # batch size, so no filler rows are needed. A single short chunk runs eagerly at its
+    # own length rather than paying for full-size encoder work.
+    use_compiled = hasattr(model, "compiled_forward") and (
+        len(chunks) > 1 or len(chunks[0]) == PADDED_CHUNK_TOKENS
+    )
 
     summaries = []
-    for chunk in chunks:
-        summary = summarizer(chunk, max_length=400, min_length=150, do_sample=False)
-        summaries.append(summary[0]["summary_text"].strip())
-    return " ".join(summaries)
+    for i in range(0, len(chunks), BATCH_SIZE):
+        batch = tokenizer.pad(
+            {"input_ids": chunks[i:i + BATCH_SIZE]},
+            padding="max_length" if use_compiled else "longest",
+            max_length=PADDED_CHUNK_TOKENS,
+            return_tensors="pt",
+        ).to(model.device)
+        generate_kwargs = dict(
+            max_length=SUMMARY_MAX_LENGTH,
+            min_length=SUMMARY_MIN_LENGTH,
+            num_beams=NUM_BEAMS,
+            do_sample=False,
+        )
+
+        if use_compiled:
+            try:
+                # our compiled forward replaces transformers' own generate() auto-compile
+                with _compiled_forward(model):
+                    output_ids = model.generate(
+                        **batch, **generate_kwargs, cache_implementation="static", disable_compile=True
+                    )
+            except Exception as e:
+                print(f"[WARN] Compiled generation failed, using the eager model from now on: {e}")
+                del model.compiled_forward
+                use_compiled = False
+                output_ids = model.generate(**batch, **generate_kwargs)
+        else:
+            output_ids = model.generate(**batch, **generate_kwargs)
+        summaries.extend(tokenizer.batch_decode(output_ids, skip_special_tokens=True))
+    return " ".join(summary.strip() for summary in summaries)
 
 
 def extractive_summary(text: str, sentence_count: int = 5):
     """Simple LexRank extractive summarizer (fallback if model unavailable)."""
-    parser = PlaintextParser.from_string(text, Tokenizer("english"))
-    summarizer = LexRankSummarizer()
-    summary = summarizer(parser.document, sentence_count)
+    global _TOKENIZER
+    if _TOKENIZER is None:
+        _TOKENIZER = Tokenizer("english")
+    parser = PlaintextParser.from_string(text, _TOKENIZER)
+    summary = _LEX(parser.document, sentence_count)
     return " ".join(str(sentence) for sentence in summary)
 
 
+def summarize_text(text: str, model=None, tokenizer=None):
+    """Summarize a transcript with BART, or with LexRank alone when no model is given."""
+    if model is None:
+        return extractive_summary(text)
+
+    # two-stage: extractive cut first so long videos need a single BART pass
+    if len(text) > LONG_TRANSCRIPT_CHARS:
+        text = extractive_summary(text, sentence_count=LONG_TRANSCRIPT_SENTENCES)
+    return abstractive_summary(text, model, tokenizer)
+
+
+def save_summary(video_id: str, summary_text: str) -> Path:
+    """Write a summary to data/summaries and return its path."""
+    output_file = SUMM_DIR / f"{video_id}_summary.txt"
+    # write to a temp file and rename, so a crash never leaves a partial summary
+    tmp_file = output_file.with_suffix(".txt.tmp")
+    tmp_file.write_text(summary_text, encoding="utf-8")
+    os.replace(tmp_file, output_file)
+    return output_file
+
+
 def main():
-    # Try loading abstractive summarizer
-    use_extractive = False
-    summarizer = None
-    try:
-        summarizer = pipeline("summarization", model="facebook/bart-large-cnn", device_map="auto")
-    except Exception as e:
-        print(f"[WARN] Falling back to extractive summarization due to: {e}")
-        use_extractive = True
+    index = load_index()
 
     transcripts = sorted(TRANS_DIR.glob("*.txt"))
-    print(f"Found {len(transcripts)} transcripts to summarize.\n")
 
-    for tfile in tqdm(transcripts, desc="Summarizing transcripts"):
+    # Skip already summarized and too-short transcripts before loading any model
+    pending = []
+    for tfile in transcripts:
         video_id = tfile.stem
         output_file = SUMM_DIR / f"{video_id}_summary.txt"
-
-        # Skip if already summarized
         if output_file.exists():
+            # record the summary if an earlier run did not
+            if video_id in index and "summary_path" not in index[video_id]:
+                update_index(video_id, {"summary_path": str(output_file)})
             continue
-
         try:
             with open(tfile, "r", encoding="utf-8") as f:
                 text = f.read().strip()
+        except Exception as e:
+            print(f"[WARN] Failed to read {tfile.name}: {e}")
+            continue
+        if len(text) >= MIN_TRANSCRIPT_CHARS:
+            pending.append((tfile, text))
 
-            if len(text) < 100:
-                continue
+    print(f"Found {len(transcripts)} transcripts, {len(pending)} to summarize.\n")
+    if not pending:
+        print("Nothing to do.")
+        return
 
-            summary_text = (
-                extractive_summary(text)
-                if use_extractive
-                else abstractive_summary(text, summarizer)
-            )
+    # Try loading abstractive summarizer
+    model = tokenizer = None
+    try:
+        model, tokenizer = load_model()
+    except Exception as e:
+        print(f"[WARN] Falling back to extractive summarization due to: {e}")
 
-            with open(output_file, "w", encoding="utf-8") as f:
-                f.write(summary_text)
+    for tfile, text in tqdm(pending, total=len(pending), mininterval=1.0, desc="Summarizing transcripts"):
+        video_id = tfile.stem
+
+        try:
+            summary_text = summarize_text(text, model, tokenizer)
+            output_file = save_summary(video_id, summary_text)
 
             # update metadata with summary path
-            meta_file = META_DIR / f"{video_id}.json"
-            if meta_file.exists():
-                with open(meta_file, "r", encoding="utf-8") as f:
-                    meta = json.load(f)
-                meta["summary_path"] = str(output_file)
-                with open(meta_file, "w", encoding="utf-8") as f:
-                    json.dump(meta, f, ensure_ascii=False, indent=2)
+            if video_id in index:
+                update_index(video_id, {"summary_path": str(output_file)})
 
         except Exception as e:
             print(f"[WARN] Failed to summarize {tfile.name}: {e}")
@@ -6,70 +6,154 @@ Transcribes audio files in data/audio/ using faster-whisper.
 Outputs transcripts to data/transcripts/<video_id>.txt and .json.
 """
 
-import json
+import os
+import subprocess
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from faster_whisper import WhisperModel
+
+import numpy as np
+import orjson
+import torch
+from faster_whisper import WhisperModel, BatchedInferencePipeline
 from tqdm import tqdm
 
+from metadata import load_index, update_index
+
 BASE_DIR = Path(__file__).resolve().parents[1]
 AUDIO_DIR = BASE_DIR / "data" / "audio"
-META_DIR = BASE_DIR / "data" / "metadata"
 TRANS_DIR = BASE_DIR / "data" / "transcripts"
 TRANS_DIR.mkdir(parents=True, exist_ok=True)
 
-# Choose model size: "tiny", "base", "small", "medium", "large-v3"
-MODEL_SIZE = "small"
-
-
-def transcribe_audio(audio_path: Path, model: WhisperModel):
-    """Transcribe a single audio file and return text + segments"""
-    segments, info = model.transcribe(str(audio_path), beam_size=5)
-    full_text = []
-    segment_list = []
-
-    for seg in segments:
-        segment_list.append({
-            "start": seg.start,
-            "end": seg.end,
-            "text": seg.text.strip()
-        })
-        full_text.append(seg.text.strip())
-
-    return " ".join(full_text), segment_list
+# Choose model size: "tiny", "base", "small", "medium", "large-v3", or a
+# CTranslate2 model repo. Distil-Whisper keeps only 2 decoder layers and is English-only.
+MODEL_SIZE = "Systran/faster-distil-whisper-large-v3"
+
+# Number of audio chunks decoded together by the batched pipeline
+BATCH_SIZE = 16
+
+# Greedy decoding by default; override with WHISPER_BEAM_SIZE for beam search
+BEAM_SIZE = int(os.environ.get("WHISPER_BEAM_SIZE", "1"))
+
+
+# Number of audio files decoded ahead of the one being transcribed
+PREFETCH = 2
+
+# faster-whisper expects 16 kHz mono float32 samples
+SAMPLE_RATE = 16000
+
+
+def decode_audio(audio_path: Path) -> np.ndarray:
+    """Decode an audio file to 16 kHz mono float32 samples with ffmpeg"""
+    pcm = subprocess.check_output([
+        "ffmpeg", "-nostdin", "-loglevel", "error",
+        "-i", str(audio_path),
+        "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "-",
+    ])
+    return np.frombuffer(pcm, np.int16).astype(np.float32) / 32768.0
+
+
+def prefetch_audio(audio_files: list, depth: int = PREFETCH):
+    """Yield (audio_path, future) pairs, decoding up to `depth` files ahead in background threads"""
+    with ThreadPoolExecutor(max_workers=depth) as executor:
+        queued = deque()
+        for audio_path in audio_files:
+            queued.append((audio_path, executor.submit(decode_audio, audio_path)))
+            if len(queued) > depth:
+                yield queued.popleft()
+        while queued:
+            yield queued.popleft()
+
+
+def transcribe_audio(audio: np.ndarray, model: BatchedInferencePipeline):
+    """Transcribe decoded audio samples and return text + segments"""
+    segments, info = model.transcribe(
+        audio,
+        batch_size=BATCH_SIZE,
+        word_timestamps=False,
+        beam_size=BEAM_SIZE,
+        best_of=1,
+        temperature=0,
+        language="en",
+        # drop silence with Silero VAD; the speech chunks form the batch
+        vad_filter=True,
+        vad_parameters=dict(min_silence_duration_ms=500),
+    )
+    # strip each segment once and build the full text from the same list
+    segment_list = [{"start": seg.start, "end": seg.end, "text": seg.text.strip()} for seg in segments]
+    full_text = " ".join(seg["text"] for seg in segment_list)
+
+    return full_text, segment_list
+
+
+def load_model() -> BatchedInferencePipeline:
+    """Load the whisper model wrapped in a batched inference pipeline"""
+    # int8 weights with fp16 activations on GPU, plain int8 on CPU
+    if torch.cuda.is_available():
+        device, compute_type = "cuda", "int8_float16"
+    else:
+        device, compute_type = "cpu", "int8"
+    model = WhisperModel(
+        MODEL_SIZE,
+        device=device,
+        compute_type=compute_type,
+        cpu_threads=os.cpu_count() or 0,
+        num_workers=2,
+    )
+    return BatchedInferencePipeline(model=model)
+
+
+def save_transcript(video_id: str, text: str, segments: list) -> Path:
+    """Write transcript text + segments to data/transcripts and return the text path"""
+    transcript_path = TRANS_DIR / f"{video_id}.txt"
+    transcript_json = TRANS_DIR / f"{video_id}.json"
+
+    # write to temp files and rename, so a crash never leaves a partial file;
+    # the .txt marks the video as done, so it goes last
+    tmp_json = transcript_json.with_suffix(".json.tmp")
+    tmp_json.write_bytes(orjson.dumps(segments, option=orjson.OPT_INDENT_2))
+    os.replace(tmp_json, transcript_json)
+
+    tmp_path = transcript_path.with_suffix(".txt.tmp")
+    tmp_path.write_text(text, encoding="utf-8")
+    os.replace(tmp_path, transcript_path)
+    return transcript_path
 
 
 def main():
-    model = WhisperModel(MODEL_SIZE, device="auto")
+    index = load_index()
 
     audio_files = sorted(AUDIO_DIR.glob("*.mp3"))
-    print(f"Found {len(audio_files)} audio files to transcribe.\n")
-
-    for audio_path in tqdm(audio_files, desc="Transcribing files"):
+    pending_audio = []
+    for audio_path in audio_files:
         video_id = audio_path.stem
         transcript_path = TRANS_DIR / f"{video_id}.txt"
-        transcript_json = TRANS_DIR / f"{video_id}.json"
-
-        # Skip already processed
-        if transcript_path.exists():
-            continue
+        if not transcript_path.exists():
+            pending_audio.append(audio_path)
+        # Skip already processed, recording the transcript if an earlier run did not
+        elif video_id in index and "transcript_path" not in index[video_id]:
+            update_index(video_id, {"transcript_path": str(transcript_path)})
+
+    print(f"Found {len(audio_files)} audio files, {len(pending_audio)} to transcribe.\n")
+    if not pending_audio:
+        print("Nothing to do.")
+        return
+
+    batched = load_model()
+
+    # decode upcoming files on the CPU while the current one is transcribed
+    decoded_audio = prefetch_audio(pending_audio)
+    progress = tqdm(decoded_audio, total=len(pending_audio), mininterval=1.0, desc="Transcribing files")
+    for audio_path, decoded in progress:
+        video_id = audio_path.stem
 
         try:
-            text, segments = transcribe_audio(audio_path, model)
-
-            with open(transcript_path, "w", encoding="utf-8") as f:
-                f.write(text)
-
-            with open(transcript_json, "w", encoding="utf-8") as f:
-                json.dump(segments, f, ensure_ascii=False, indent=2)
+            text, segments = transcribe_audio(decoded.result(), batched)
+            transcript_path = save_transcript(video_id, text, segments)
 
             # update metadata with transcript path
-            meta_file = META_DIR / f"{video_id}.json"
-            if meta_file.exists():
-                with open(meta_file, "r", encoding="utf-8") as f:
-                    meta = json.load(f)
-                meta["transcript_path"] = str(transcript_path)
-                with open(meta_file, "w", encoding="utf-8") as f:
-                    json.dump(meta, f, ensure_ascii=False, indent=2)
+            if video_id in index:
+                update_index(video_id, {"transcript_path": str(transcript_path)})
 
         except Exception as e:
             print(f"[WARN] Failed to transcribe {audio_path.name}: {e}")